@@ -1,10 +1,18 @@
+import collections
+import functools
+import hashlib
+import json
+import math
 import os
-import re
 import shutil
+import string
 import subprocess
 import sys
 import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
 from pathlib import Path
 from urllib.parse import urlparse
 from comfy.comfy_types import IO
@@ -28,6 +36,18 @@ def _resolve_output_dir():
 
 
 OUTPUT_DIR = _resolve_output_dir()
+# Downloaded URLs, keyed by a hash of the URL
+CACHE_DIR = OUTPUT_DIR / "_cache"
+_CACHE_LOCKS = {}
+_CACHE_LOCKS_LOCK = threading.Lock()
+
+# Lines of ffmpeg stderr kept for error messages
+_STDERR_TAIL_LINES = 500
+
+# Limits for looping decoded video in memory with the loop filter
+# (the filter's size option tops out at 32767 frames)
+_LOOP_FILTER_MAX_FRAMES = 32767
+_LOOP_FILTER_MAX_BYTES = 1024 * 1024 * 1024
 
 
 def _which(cmd):
@@ -35,19 +55,105 @@ def _which(cmd):
     return shutil.which(cmd)
 
 
+# Resolved once at import; PATH lookups are not repeated per call.
+# All spawns pass close_fds=False with absolute paths so CPython can use
+# posix_spawn instead of fork() of the (large) ComfyUI process. Our own fds
+# are non-inheritable (PEP 446), so nothing leaks into ffmpeg.
+_FFMPEG = _which("ffmpeg")
+_FFPROBE = _which("ffprobe")
+
+
 def _require_ffmpeg():
-    if not _which("ffmpeg"):
+    if _FFMPEG is None:
         raise RuntimeError(
             "ffmpeg not found on PATH. Please install ffmpeg and ensure 'ffmpeg' and 'ffprobe' are available."
         )
-    if not _which("ffprobe"):
+    if _FFPROBE is None:
         raise RuntimeError(
             "ffprobe not found on PATH. Please install ffmpeg (which includes ffprobe)."
         )
 
 
+# Hardware H.264 encoders in order of preference, with their encoder args.
+_HW_ENCODER_ARGS = {
+    # Low-delay NVENC: no B-frames, no lookahead, no extra surface queueing
+    "h264_nvenc": [
+        "-c:v", "h264_nvenc", "-preset", "p4", "-tune", "ull",
+        "-delay", "0", "-bf", "0", "-rc-lookahead", "0",
+        "-b:v", "4M", "-pix_fmt", "yuv420p",
+    ],
+    "h264_qsv": ["-c:v", "h264_qsv", "-preset", "medium", "-b:v", "4M", "-pix_fmt", "nv12"],
+    "h264_videotoolbox": ["-c:v", "h264_videotoolbox", "-b:v", "4M", "-pix_fmt", "yuv420p"],
+}
+_SW_ENCODER_ARGS = ["-c:v", "libx264", "-pix_fmt", "yuv420p", "-preset", "veryfast", "-crf", "20"]
+_AAC_ENCODE_ARGS = ["-c:a", "aac", "-b:a", "192k"]
+
+# Cached result of _detect_hw_encoder(); None until probed, "" if no hw encoder works
+_HW_ENCODER = None
+
+
+def _detect_hw_encoder() -> str:
+    """Return the name of a usable hardware H.264 encoder, or "" if none. Probed once."""
+    global _HW_ENCODER
+    if _HW_ENCODER is not None:
+        return _HW_ENCODER
+    _HW_ENCODER = ""
+    try:
+        proc = subprocess.run(
+            [_FFMPEG, "-hide_banner", "-encoders"],
+            capture_output=True,
+            text=True,
+            check=True,
+            close_fds=False,
+        )
+    except Exception:
+        return _HW_ENCODER
+    for name, args in _HW_ENCODER_ARGS.items():
+        if name not in proc.stdout:
+            continue
+        # Being compiled in doesn't mean a device is present; try a tiny encode
+        test = subprocess.run(
+            [_FFMPEG, "-hide_banner", "-loglevel", "error",
+             "-f", "lavfi", "-i", "color=black:s=256x256:d=0.1",
+             *args, "-f", "null", "-"],
+            capture_output=True,
+            text=True,
+            close_fds=False,
+        )
+        if test.returncode == 0:
+            _HW_ENCODER = name
+            break
+    return _HW_ENCODER
+
+
+def _video_encoder_args() -> list:
+    """Video encoder args for merges: hardware H.264 if available, else libx264."""
+    hw = _detect_hw_encoder()
+    if hw:
+        return list(_HW_ENCODER_ARGS[hw])
+    return list(_SW_ENCODER_ARGS)
+
+
+class _SafeFilenameTable(dict):
+    """str.translate table: keeps [A-Za-z0-9._-], maps everything else (incl. non-ASCII) to '_'."""
+
+    def __missing__(self, key):
+        return "_"
+
+
+_SAFE_TABLE = _SafeFilenameTable(
+    (ord(c), c) for c in string.ascii_letters + string.digits + "._-"
+)
+
+
 def _safe_filename(name: str) -> str:
-    name = re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("._-")
+    # Plain ASCII alphanumerics (e.g. "video", "audio") are already safe
+    if name.isascii() and name.isalnum():
+        return name
+    name = name.translate(_SAFE_TABLE)
+    while "__" in name:
+        name = name.replace("__", "_")
+    name = name.strip("._-")
     return name or str(int(time.time()))
 
 
@@ -57,21 +163,55 @@ def _guess_ext_from_url(url: str, default: str = "") -> str:
     return ext if ext else default
 
 
+# Shared HTTP session (connection pooling + retries), created on first download
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def _get_session():
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            import requests  # type: ignore
+            from requests.adapters import HTTPAdapter  # type: ignore
+            from urllib3.util.retry import Retry  # type: ignore
+
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=8,
+                max_retries=Retry(total=3, backoff_factor=0.2),
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _SESSION = session
+        return _SESSION
+
+
 def _download_direct(url: str, dest: Path) -> Path:
     try:
-        import requests  # type: ignore
+        session = _get_session()
     except Exception as e:
         raise RuntimeError("The 'requests' package is required to download direct URLs. Please install it.") from e
 
-    with requests.get(url, stream=True, timeout=60) as r:
+    with session.get(url, stream=True, timeout=60) as r:
         r.raise_for_status()
+        # Let urllib3 undo any Content-Encoding, then copy in 4 MiB blocks
+        r.raw.decode_content = True
         with open(dest, "wb") as f:
-            for chunk in r.iter_content(chunk_size=1024 * 512):
-                if chunk:
-                    f.write(chunk)
+            shutil.copyfileobj(r.raw, f, length=4 * 1024 * 1024)
     return dest
 
 
+def _prewarm_yt_dlp():
+    """Import yt_dlp in the background so the first URL download doesn't pay for it."""
+    try:
+        import yt_dlp  # type: ignore  # noqa: F401
+    except Exception:
+        # Missing/broken yt-dlp is reported when it is actually needed
+        pass
+
+
 def _download_with_yt_dlp(url: str, out_dir: Path, base_name: str) -> Path:
     try:
         import yt_dlp  # type: ignore
@@ -100,54 +240,150 @@ def _download_with_yt_dlp(url: str, out_dir: Path, base_name: str) -> Path:
     return Path(filename)
 
 
-def _download_media(url: str, out_dir: Path, label: str, media_type: str) -> Path:
-    """
-    Download media from a URL or copy from local path.
-    media_type: 'video' or 'audio' for naming.
-    Returns local file path.
+def _cache_lock(key: str) -> threading.Lock:
+    """Per-key lock so concurrent downloads of one URL don't write the same cache files."""
+    with _CACHE_LOCKS_LOCK:
+        return _CACHE_LOCKS.setdefault(key, threading.Lock())
+
+
+def _find_cached(key: str):
+    """Return a completed cached download named '<key>.<ext>', or None."""
+    for p in CACHE_DIR.glob(f"{key}.*"):
+        # Skips yt-dlp's in-progress files (key.webm.part, key.f137.mp4, key.temp.mp4, ...)
+        if p.stem == key and p.suffix not in (".part", ".ytdl") and p.stat().st_size > 0:
+            return p
+    return None
+
+
+def _link_into(cached: Path, dest: Path) -> Path:
+    """Symlink a cached download into the session dir; use the cached path if that fails."""
+    try:
+        if dest.is_symlink() or dest.exists():
+            dest.unlink()
+        os.symlink(cached, dest)
+        return dest
+    except OSError:
+        return cached
+
+
+def _check_source(url: str, media_type: str):
+    """Cheap checks on an input string, so a bad one fails before any download starts.
+
+    Returns the resolved local path for local inputs, None for HTTP(S) URLs.
     """
     if not url:
         raise ValueError(f"{media_type} url is empty")
-
     parsed = urlparse(url)
-    base = _safe_filename(label)
-
-    # Local file path
     if parsed.scheme in ("", "file"):
         local_path = Path(parsed.path if parsed.scheme == "file" else url)
         if not local_path.exists():
             raise FileNotFoundError(f"Local path not found: {local_path}")
-        dest = out_dir / f"{base}{local_path.suffix or ''}"
-        if local_path.resolve() != dest.resolve():
-            shutil.copyfile(local_path, dest)
-        else:
-            # Already in place
-            pass
-        return dest
+        return local_path.resolve()
+    if parsed.scheme not in ("http", "https"):
+        raise ValueError(f"Unsupported URL scheme: {parsed.scheme}")
+    return None
+
 
-    # HTTP(S) URL
-    if parsed.scheme in ("http", "https"):
-        # Decide whether to attempt direct download vs yt-dlp
-        ext = _guess_ext_from_url(url)
-        direct_exts = {".mp4", ".mov", ".mkv", ".avi", ".webm", ".mp3", ".wav", ".m4a", ".aac", ".flac", ".ogg", ".opus"}
+def _download_media(url: str, out_dir: Path, label: str, media_type: str) -> Path:
+    """
+    Download media from a URL, or resolve a local path (used in place, not copied).
+    media_type: 'video' or 'audio' for naming.
+    Returns local file path.
+    """
+    local_path = _check_source(url, media_type)
+    if local_path is not None:
+        # ffmpeg only reads inputs, so use the file in place instead of copying it
+        return local_path
+
+    # HTTP(S) URL: downloads are cached by URL hash and reused across runs
+    base = _safe_filename(label)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    # Decide whether to attempt direct download vs yt-dlp
+    ext = _guess_ext_from_url(url)
+    direct_exts = {".mp4", ".mov", ".mkv", ".avi", ".webm", ".mp3", ".wav", ".m4a", ".aac", ".flac", ".ogg", ".opus"}
+    # Same URL for video and audio: the second download waits and reuses the first
+    with _cache_lock(key):
         if ext in direct_exts:
-            dest = out_dir / f"{base}{ext}"
-            return _download_direct(url, dest)
-        # Fallback to yt-dlp for non-direct URLs (e.g., YouTube)
-        return _download_with_yt_dlp(url, out_dir, base)
+            cached = CACHE_DIR / f"{key}{ext}"
+            if not (cached.is_file() and cached.stat().st_size > 0):
+                # Download under a temp name so an interrupted download is never reused
+                part = CACHE_DIR / f"{key}{ext}.{os.getpid()}.{threading.get_ident()}.part"
+                try:
+                    _download_direct(url, part)
+                    os.replace(part, cached)
+                finally:
+                    if part.exists():
+                        part.unlink()
+        else:
+            cached = _find_cached(key)
+            if cached is None:
+                # Fallback to yt-dlp for non-direct URLs (e.g., YouTube)
+                cached = _download_with_yt_dlp(url, CACHE_DIR, key)
+    return _link_into(cached, out_dir / f"{base}{cached.suffix}")
+
+
+def _run_ffmpeg(cmd: list, error_msg: str) -> None:
+    """Run an ffmpeg command, keeping only the tail of stderr for error reporting."""
+    tail = collections.deque(maxlen=_STDERR_TAIL_LINES)
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        errors="replace",
+        close_fds=False,
+    )
+
+    def _drain():
+        for line in proc.stderr:
+            tail.append(line.rstrip("\n"))
+
+    drainer = threading.Thread(target=_drain, daemon=True)
+    drainer.start()
+    returncode = proc.wait()
+    drainer.join()
+    proc.stderr.close()
+    if returncode != 0:
+        raise RuntimeError("\n".join(tail).strip() or error_msg)
+
+
+@functools.lru_cache(maxsize=32)
+def _probe(path_str: str, mtime_ns: int) -> dict:
+    """Run ffprobe once for format + streams and return the parsed JSON.
+
+    Cached by (absolute path, mtime) so repeated probes of the same file are free.
+    Errors are raised (and therefore not cached).
+    """
+    proc = subprocess.run(
+        [_FFPROBE, "-v", "error", "-show_format", "-show_streams", "-of", "json", path_str],
+        capture_output=True,
+        text=True,
+        check=True,
+        close_fds=False,
+    )
+    return json.loads(proc.stdout)
+
+
+def _probe_path(path: Path) -> dict:
+    """Cached ffprobe info for path, or {} if it can't be probed."""
+    try:
+        p = Path(path).resolve()
+        return _probe(str(p), p.stat().st_mtime_ns)
+    except Exception:
+        return {}
 
-    raise ValueError(f"Unsupported URL scheme: {parsed.scheme}")
 
+def _probe_duration_seconds(path: Path, codec_type: str) -> float:
+    """Duration of the first codec_type ('video'/'audio') stream, else of the container.
 
-def _probe_duration_seconds(path: Path) -> float:
+    The container duration covers the longest stream, so it can overstate e.g. a
+    short video stream muxed with a longer audio track.
+    """
     try:
-        proc = subprocess.run(
-            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", str(path)],
-            capture_output=True,
-            text=True,
-            check=True,
-        )
-        dur = float(proc.stdout.strip())
+        info = _probe_path(path)
+        stream = next((st for st in info.get("streams", []) if st.get("codec_type") == codec_type), {})
+        dur = float(stream.get("duration") or info["format"]["duration"])
         if dur <= 0:
             raise ValueError
         return dur
@@ -156,53 +392,230 @@ def _probe_duration_seconds(path: Path) -> float:
         return 0.0
 
 
-def _ffmpeg_merge_loop(video_path: Path, audio_path: Path, duration: float, out_path: Path) -> None:
-    """Try looping both video and audio with -stream_loop and trim to duration."""
+def _probe_codecs(path: Path) -> dict:
+    """Return codec info of the first video/audio streams: video_codec, pix_fmt, audio_codec."""
+    info = {"video_codec": None, "pix_fmt": None, "audio_codec": None}
+    for st in _probe_path(path).get("streams", []):
+        if st.get("codec_type") == "video" and info["video_codec"] is None:
+            info["video_codec"] = st.get("codec_name")
+            info["pix_fmt"] = st.get("pix_fmt")
+        elif st.get("codec_type") == "audio" and info["audio_codec"] is None:
+            info["audio_codec"] = st.get("codec_name")
+    return info
+
+
+def _can_stream_copy(video_path: Path, audio_path: Path) -> bool:
+    """True if the inputs are already H.264/yuv420p and AAC, so merging needs no re-encode."""
+    v = _probe_codecs(video_path)
+    a = _probe_codecs(audio_path)
+    return (
+        v["video_codec"] == "h264"
+        and v["pix_fmt"] == "yuv420p"
+        and a["audio_codec"] == "aac"
+    )
+
+
+def _scratch_dir():
+    """Return "/dev/shm" (RAM-backed tmpfs) if present, else None (system temp).
+
+    Only for small scratch files such as concat lists; encoded intermediates can
+    be large and /dev/shm is shared with ComfyUI/PyTorch.
+    """
+    # Read-only or locked-down containers may have a /dev/shm we can't write to
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK | os.X_OK):
+        return "/dev/shm"
+    return None
+
+
+def _concat_entry(path: Path) -> str:
+    """A concat demuxer list line for path: absolute, single quotes escaped for the demuxer."""
+    quoted = path.resolve().as_posix().replace("'", "'\\''")
+    return f"file '{quoted}'\n"
+
+
+def _ffmpeg_copy_loop(video_path: Path, audio_path: Path, duration: float, out_path: Path) -> None:
+    """Loop already-compatible inputs to duration with -c copy (no re-encode)."""
+    vdur = _probe_duration_seconds(video_path, "video")
+    if vdur <= 0:
+        raise RuntimeError("Unknown video duration; cannot build concat list for stream copy")
+    repeats = max(1, math.ceil(duration / vdur))
+
+    with tempfile.TemporaryDirectory(dir=_scratch_dir()) as td:
+        concat_list = Path(td) / "concat_list.txt"
+        with open(concat_list, "w", encoding="utf-8") as f:
+            for _ in range(repeats):
+                f.write(_concat_entry(video_path))
+
+        cmd = [
+            _FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "concat", "-safe", "0", "-i", str(concat_list),
+            "-stream_loop", "-1", "-i", str(audio_path),
+            "-map", "0:v:0", "-map", "1:a:0",
+            "-t", f"{duration:.3f}",
+            "-c", "copy",
+            "-shortest",
+            str(out_path),
+        ]
+        _run_ffmpeg(cmd, "ffmpeg failed during stream-copy merge")
+
+
+def _ffmpeg_trim(video_path: Path, audio_path: Path, duration: float, out_path: Path) -> None:
+    """Merge inputs that are both at least duration long: one pass, no looping.
+
+    Streams already in the output codecs (H.264/yuv420p, AAC) are copied.
+    """
+    vcodecs = _probe_codecs(video_path)
+    if vcodecs["video_codec"] == "h264" and vcodecs["pix_fmt"] == "yuv420p":
+        video_args = ["-c:v", "copy"]
+    else:
+        video_args = _video_encoder_args()
+    if _probe_codecs(audio_path)["audio_codec"] == "aac":
+        audio_args = ["-c:a", "copy"]
+    else:
+        audio_args = _AAC_ENCODE_ARGS
+
     cmd = [
-        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
-        "-stream_loop", "-1", "-i", str(video_path),
-        "-stream_loop", "-1", "-i", str(audio_path),
+        _FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
+        "-i", str(video_path),
+        "-i", str(audio_path),
+        "-map", "0:v:0", "-map", "1:a:0",
         "-t", f"{duration:.3f}",
-        "-c:v", "libx264", "-pix_fmt", "yuv420p", "-preset", "veryfast", "-crf", "20",
-        "-c:a", "aac", "-b:a", "192k",
-        "-shortest",
+        *video_args,
+        *audio_args,
         str(out_path),
     ]
-    proc = subprocess.run(cmd, capture_output=True, text=True)
-    if proc.returncode != 0:
-        raise RuntimeError(proc.stderr.strip() or "ffmpeg failed during merge")
+    _run_ffmpeg(cmd, "ffmpeg failed during trim")
+
+
+def _prepare_loop_segment(video_path: Path, out: Path, duration: float) -> Path:
+    """Encode one pass of the video (no audio, at most duration long) to an H.264 segment."""
+    cmd = [
+        _FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
+        "-i", str(video_path),
+        "-t", f"{duration:.3f}",
+        "-map", "0:v:0", "-an",
+        *_video_encoder_args(),
+        str(out),
+    ]
+    _run_ffmpeg(cmd, "ffmpeg failed while encoding loop segment")
+    return out
+
 
+def _prepare_loop_audio(audio_path: Path, out: Path, duration: float, audio_codec_args: list = None) -> Path:
+    """Bring the audio (at most duration long) to AAC once so it can be looped with stream copy.
 
-def _ffmpeg_concat_then_merge(video_path: Path, audio_path: Path, duration: float, out_path: Path) -> None:
+    audio_codec_args defaults to an AAC encode; pass ["-c:a", "copy"] for AAC sources.
+    """
+    cmd = [
+        _FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
+        "-i", str(audio_path),
+        "-t", f"{duration:.3f}",
+        "-map", "0:a:0", "-vn",
+        *(audio_codec_args or _AAC_ENCODE_ARGS),
+        str(out),
+    ]
+    _run_ffmpeg(cmd, "ffmpeg failed while encoding loop audio")
+    return out
+
+
+def _ffmpeg_merge_loop(video_path: Path, audio_path: Path, duration: float, out_path: Path, audio_codec_args: list = None) -> None:
+    """Encode one loop iteration of video and audio, then stream-copy loop them to duration."""
+    with tempfile.TemporaryDirectory() as td:
+        # Separate ffmpeg processes, so the (GPU) video and (CPU) audio encodes overlap
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            fv = ex.submit(_prepare_loop_segment, video_path, Path(td) / "segment.mp4", duration)
+            fa = ex.submit(_prepare_loop_audio, audio_path, Path(td) / "audio.m4a", duration, audio_codec_args)
+            segment = fv.result()
+            audio_norm = fa.result()
+        _ffmpeg_copy_loop(segment, audio_norm, duration, out_path)
+
+
+def _loop_filter_sizes(video_path: Path, audio_path: Path):
+    """Return (frames, samples) for one loop of each input, or raise if the loop won't fit in memory."""
+    vinfo = _probe_path(video_path)
+    ainfo = _probe_path(audio_path)
+    vstream = next(st for st in vinfo.get("streams", []) if st.get("codec_type") == "video")
+    astream = next(st for st in ainfo.get("streams", []) if st.get("codec_type") == "audio")
+
+    vdur = _probe_duration_seconds(video_path, "video")
+    adur = _probe_duration_seconds(audio_path, "audio")
+    # ffprobe reports an unknown rate as "0/0"
+    rate = vstream.get("avg_frame_rate")
+    if not rate or rate.startswith("0/") or rate.endswith("/0"):
+        rate = vstream["r_frame_rate"]
+    fps = float(Fraction(rate))
+    frames = math.ceil(vdur * fps)
+    samples = math.ceil(adur * int(astream["sample_rate"]))
+    if frames <= 0 or samples <= 0:
+        raise ValueError("Could not determine loop sizes")
+    if frames > _LOOP_FILTER_MAX_FRAMES:
+        raise ValueError("Video too long to loop in the filter graph")
+    # loop keeps decoded frames in RAM (~1.5 bytes/pixel for yuv420p)
+    if frames * int(vstream["width"]) * int(vstream["height"]) * 3 // 2 > _LOOP_FILTER_MAX_BYTES:
+        raise ValueError("Video too large to loop in the filter graph")
+    return frames, samples
+
+
+def _ffmpeg_filter_loop(video_path: Path, audio_path: Path, duration: float, out_path: Path, copy_audio: bool = False) -> None:
+    """Decode each input once and loop it with the loop/aloop filters, then encode to duration with libx264.
+
+    copy_audio: stream-copy the (already AAC) audio instead of encoding it.
+    """
+    frames, samples = _loop_filter_sizes(video_path, audio_path)
+
+    if copy_audio:
+        # Copied audio can't go through a filter; loop it at the demuxer instead
+        audio_input = ["-stream_loop", "-1", "-i", str(audio_path)]
+        graph = f"[0:v]loop=loop=-1:size={frames}:start=0[v]"
+        audio_map = "1:a:0"
+    else:
+        audio_input = ["-i", str(audio_path)]
+        graph = f"[0:v]loop=loop=-1:size={frames}:start=0[v];[1:a]aloop=loop=-1:size={samples}[a]"
+        audio_map = "[a]"
+
+    cmd = [
+        _FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
+        "-i", str(video_path),
+        *audio_input,
+        "-filter_complex", graph,
+        "-map", "[v]", "-map", audio_map,
+        "-t", f"{duration:.3f}",
+        # libx264: this runs after the hardware-encoded merge path has failed
+        *_SW_ENCODER_ARGS,
+        *(["-c:a", "copy"] if copy_audio else _AAC_ENCODE_ARGS),
+        str(out_path),
+    ]
+    _run_ffmpeg(cmd, "ffmpeg failed during filter-loop merge")
+
+
+def _ffmpeg_concat_then_merge(video_path: Path, audio_path: Path, duration: float, out_path: Path, audio_codec_args: list = None) -> None:
     """Fallback: make a concat list repeating the video enough times, then merge with audio and trim."""
     # Determine repeats needed
-    vdur = _probe_duration_seconds(video_path)
+    vdur = _probe_duration_seconds(video_path, "video")
     repeats = 1
     if vdur > 0 and duration > 0:
-        import math
         repeats = max(1, math.ceil(duration / vdur))
 
-    with tempfile.TemporaryDirectory() as td:
+    with tempfile.TemporaryDirectory(dir=_scratch_dir()) as td:
         concat_list = Path(td) / "concat_list.txt"
         with open(concat_list, "w", encoding="utf-8") as f:
             for _ in range(repeats):
                 # Use absolute paths; -safe 0 allows it
-                f.write(f"file '{video_path.as_posix()}'\n")
+                f.write(_concat_entry(video_path))
 
         # Build FFmpeg command
         cmd = [
-            "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+            _FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
             "-f", "concat", "-safe", "0", "-i", str(concat_list),
             "-stream_loop", "-1", "-i", str(audio_path),
             "-t", f"{duration:.3f}",
-            "-c:v", "libx264", "-pix_fmt", "yuv420p", "-preset", "veryfast", "-crf", "20",
-            "-c:a", "aac", "-b:a", "192k",
+            # Last resort: always libx264, so a failing hardware encoder can't sink every path
+            *_SW_ENCODER_ARGS,
+            *(audio_codec_args or _AAC_ENCODE_ARGS),
             "-shortest",
             str(out_path),
         ]
-        proc = subprocess.run(cmd, capture_output=True, text=True)
-        if proc.returncode != 0:
-            raise RuntimeError(proc.stderr.strip() or "ffmpeg failed during concat/merge fallback")
+        _run_ffmpeg(cmd, "ffmpeg failed during concat/merge fallback")
 
 
 class XimiLofiCreation:
@@ -248,25 +661,63 @@ class XimiLofiCreation:
             raise ValueError("duration must be > 0")
 
         _require_ffmpeg()
+        # Catch bad inputs before either download starts
+        _check_source(video_str, "video")
+        _check_source(audio_str, "audio")
 
         session_dir = OUTPUT_DIR / time.strftime("%Y%m%d_%H%M%S")
         session_dir.mkdir(parents=True, exist_ok=True)
 
-        # Download/copy inputs
-        video_local = _download_media(video_str, session_dir, "video", "video")
-        audio_local = _download_media(audio_str, session_dir, "audio", "audio")
+        # Download/copy inputs concurrently; errors re-raise from .result()
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            fv = ex.submit(_download_media, video_str, session_dir, "video", "video")
+            fa = ex.submit(_download_media, audio_str, session_dir, "audio", "audio")
+            video_local = fv.result()
+            audio_local = fa.result()
 
         out_name = f"lofi_{int(time.time())}.mp4"
         out_path = session_dir / out_name
 
-        # Try simple infinite loop + trim
-        try:
-            _ffmpeg_merge_loop(video_local, audio_local, float(duration), out_path)
-        except Exception:
-            # Fallback to concat method
-            _ffmpeg_concat_then_merge(video_local, audio_local, float(duration), out_path)
-
-        # Wrap the produced file as a Comfy VIDEO output
+        merged = False
+        vdur = _probe_duration_seconds(video_local, "video")
+        adur = _probe_duration_seconds(audio_local, "audio")
+        if min(vdur, adur) >= duration:
+            # Both sources already long enough: no looping, single-pass trim
+            try:
+                _ffmpeg_trim(video_local, audio_local, float(duration), out_path)
+                merged = True
+            except Exception:
+                merged = False
+
+        # Inputs already H.264/AAC: loop with stream copy, no re-encode
+        if not merged and _can_stream_copy(video_local, audio_local):
+            try:
+                _ffmpeg_copy_loop(video_local, audio_local, float(duration), out_path)
+                merged = True
+            except Exception:
+                merged = False
+
+        if not merged:
+            # Audio that is already AAC is copied rather than re-encoded
+            copy_audio = _probe_codecs(audio_local)["audio_codec"] == "aac"
+            if copy_audio:
+                audio_codec_args = ["-c:a", "copy"]
+            else:
+                audio_codec_args = list(_AAC_ENCODE_ARGS)
+
+            # Try simple infinite loop + trim
+            try:
+                _ffmpeg_merge_loop(video_local, audio_local, float(duration), out_path, audio_codec_args)
+            except Exception:
+                try:
+                    # Decode once and loop in the filter graph, software-encoded
+                    _ffmpeg_filter_loop(video_local, audio_local, float(duration), out_path, copy_audio)
+                except Exception:
+                    # Fallback to concat method
+                    _ffmpeg_concat_then_merge(video_local, audio_local, float(duration), out_path, audio_codec_args)
+
+        # Wrap the produced file as a Comfy VIDEO output. VideoFromFile only stores
+        # the path and reads metadata lazily, so nothing is probed here.
         video_obj = VideoFromFile(str(out_path))
         return (video_obj,)
 
@@ -281,3 +732,7 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     # Internal id -> display name in UI
     "XimiLofiCreation": "lofi-creation",
 }
+
+
+# Warm up the heavy yt_dlp import while ComfyUI finishes loading
+threading.Thread(target=_prewarm_yt_dlp, name="yt_dlp-prewarm", daemon=True).start()